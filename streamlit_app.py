@@ -5,8 +5,12 @@ import firebase_admin
 from firebase_admin import credentials, firestore
 from google.cloud.firestore import Client
 from datetime import datetime, date
+from concurrent.futures import ThreadPoolExecutor
+from openpyxl import load_workbook
 import random
 import io
+import csv
+import hashlib
 
 # --- Configuración de la página y Estilos Futuristas ---
 st.set_page_config(layout="wide")
@@ -208,6 +212,173 @@ def obtener_pedidos_para_descarga():
     
     return pedidos_data
 
+# --- Importación masiva ---
+COLUMNAS_IMPORTACION = ['id_referencia', 'nombre', 'precio', 'cantidad']
+TAMANO_LOTE_FIRESTORE = 500
+HILOS_IMPORTACION = 4
+
+def leer_archivo_importacion(archivo):
+    """Lee un archivo XLSX o CSV y lo devuelve como DataFrame con las columnas de importación."""
+    if archivo.name.lower().endswith('.xlsx'):
+        libro = load_workbook(io.BytesIO(archivo.getvalue()), read_only=True, data_only=True)
+        try:
+            filas = libro.active.iter_rows(values_only=True)
+            encabezado = [str(c).strip().lower() if c is not None else '' for c in next(filas, [])]
+            df = pd.DataFrame([fila for fila in filas if any(c is not None for c in fila)], columns=encabezado)
+        finally:
+            libro.close()
+    else:
+        contenido = archivo.getvalue()
+        try:
+            texto = contenido.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            # Exportaciones de Excel en Windows suelen venir en cp1252/latin-1.
+            texto = contenido.decode('latin-1')
+        try:
+            separador = csv.Sniffer().sniff(texto[:4096], delimiters=',;\t|').delimiter
+        except csv.Error:
+            separador = ','
+        df = pd.read_csv(io.StringIO(texto), dtype=str, sep=separador, skip_blank_lines=True)
+        df.columns = [str(c).strip().lower() for c in df.columns]
+
+        if separador == ';' and 'precio' in df.columns:
+            # Los CSV con punto y coma vienen de Excel en español: punto de miles y coma decimal (15.000,50).
+            precio = df['precio'].fillna('').str.strip()
+            formato_local = precio.str.fullmatch(r'\d{1,3}(\.\d{3})+(,\d+)?|\d+(,\d+)?')
+            df['precio'] = precio.where(~formato_local, precio.str.replace('.', '', regex=False).str.replace(',', '.', regex=False))
+
+    if 'id_referencia' not in df.columns:
+        raise ValueError(
+            "No se encontró la columna 'id_referencia' en el encabezado. "
+            f"Columnas esperadas: {', '.join(COLUMNAS_IMPORTACION)}."
+        )
+
+    for columna in COLUMNAS_IMPORTACION:
+        if columna not in df.columns:
+            df[columna] = None
+    return df[COLUMNAS_IMPORTACION]
+
+def validar_importacion(df, productos_map):
+    """Valida las filas a importar contra las referencias existentes y marca cada fila con su acción o error."""
+    df = df.copy()
+    df['id_referencia'] = df['id_referencia'].fillna('').astype(str).str.strip().str.replace(r'\.0$', '', regex=True)
+    df['nombre'] = df['nombre'].fillna('').astype(str).str.strip()
+    # Un precio en texto con separador de miles (15.000) o con punto y coma a la vez no se puede interpretar con seguridad.
+    precio_texto = df['precio'].map(lambda valor: valor.strip() if isinstance(valor, str) else '')
+    precio_ambiguo = (
+        (precio_texto.str.contains('.', regex=False) & precio_texto.str.contains(',', regex=False))
+        | precio_texto.str.fullmatch(r'\d{1,3}(\.\d{3})+')
+    )
+    df['precio'] = pd.to_numeric(df['precio'], errors='coerce').where(~precio_ambiguo)
+    cantidad_texto = df['cantidad'].fillna('').astype(str).str.strip()
+    cantidad = pd.to_numeric(cantidad_texto, errors='coerce')
+    # Solo una celda vacía equivale a 0; un valor que no se puede interpretar es un error.
+    cantidad_ilegible = cantidad.isna() & (cantidad_texto != '')
+    cantidad = cantidad.fillna(0)
+
+    # Firestore no acepta como ID de documento textos con '/', '.' o '..', ni los de la forma __x__.
+    id_invalido = (
+        df['id_referencia'].str.contains('/', regex=False)
+        | df['id_referencia'].isin(['.', '..'])
+        | df['id_referencia'].str.fullmatch(r'__.*__')
+    )
+
+    existente = df['id_referencia'].isin(productos_map.keys())
+    nuevo = ~existente & (df['id_referencia'] != '') & ~id_invalido
+
+    # Una referencia nueva toma nombre y precio de la primera fila que los trae válidos.
+    datos_producto = nuevo & (df['nombre'] != '') & (df['precio'] > 0)
+    filas_producto = df[datos_producto].drop_duplicates('id_referencia').index
+    sin_datos = nuevo & ~df['id_referencia'].isin(df.loc[datos_producto, 'id_referencia'])
+
+    df['error'] = ''
+    df.loc[df['id_referencia'] == '', 'error'] = 'ID de referencia vacía'
+    df.loc[id_invalido, 'error'] = 'ID de referencia no válida'
+    df.loc[sin_datos & ~(df['precio'] > 0), 'error'] = 'Referencia nueva sin precio válido'
+    df.loc[sin_datos & (df['nombre'] == ''), 'error'] = 'Referencia nueva sin nombre'
+    df.loc[nuevo & precio_ambiguo, 'error'] = 'Precio con formato ambiguo (usa 15000 o 15000.50)'
+    df.loc[cantidad_ilegible | (cantidad < 0) | (cantidad % 1 != 0), 'error'] = 'Cantidad inválida'
+    df['cantidad'] = cantidad.where(df['error'] == '', 0).astype(int)
+    df['crear_producto'] = df.index.isin(filas_producto)
+
+    df['accion'] = 'Error'
+    df.loc[df['error'] == '', 'accion'] = 'Sin cambios'
+    df.loc[(df['error'] == '') & (df['cantidad'] > 0), 'accion'] = 'Entrada'
+    df.loc[df['crear_producto'] & (df['cantidad'] > 0), 'accion'] = 'Nueva referencia + Entrada'
+    df.loc[df['crear_producto'] & (df['cantidad'] == 0), 'accion'] = 'Nueva referencia'
+    df.loc[df['crear_producto'] & (df['error'] != ''), 'accion'] = 'Nueva referencia (sin entrada)'
+    return df
+
+def _confirmar_lote(operaciones, crear=False):
+    """Escribe un lote de operaciones (referencia de documento, datos) en una sola transacción por lotes.
+
+    Con crear=True se usa batch.create, que falla si algún documento ya existe en lugar de sobrescribirlo.
+    """
+    batch = db.batch()
+    for doc_ref, datos in operaciones:
+        if crear:
+            batch.create(doc_ref, datos)
+        else:
+            batch.set(doc_ref, datos)
+    batch.commit()
+    return len(operaciones)
+
+def _confirmar_lotes(operaciones, crear=False):
+    """Divide las operaciones en lotes y los confirma de forma concurrente. Devuelve (lotes confirmados, total, errores)."""
+    lotes = [operaciones[i:i + TAMANO_LOTE_FIRESTORE] for i in range(0, len(operaciones), TAMANO_LOTE_FIRESTORE)]
+    with ThreadPoolExecutor(max_workers=HILOS_IMPORTACION) as executor:
+        futuros = [executor.submit(_confirmar_lote, lote, crear) for lote in lotes]
+    errores = [futuro.exception() for futuro in futuros if futuro.exception() is not None]
+    return len(lotes) - len(errores), len(lotes), errores
+
+def guardar_importacion(df_validado, id_importacion, contenido_archivo):
+    """Guarda las referencias nuevas y luego los movimientos de entrada en lotes concurrentes de Firestore.
+
+    Los movimientos usan IDs derivados de la importación, el contenido del archivo y la fila, por lo que
+    reintentar una importación fallida con el mismo archivo sobrescribe los movimientos ya guardados en
+    lugar de duplicarlos.
+    """
+    fecha = datetime.now().isoformat()
+    productos_ref = db.collection('productos')
+    movimientos_ref = db.collection('inventario_movimientos')
+    huella_archivo = hashlib.sha1(contenido_archivo).hexdigest()
+
+    nuevos = df_validado[df_validado['crear_producto']]
+    entradas = df_validado[(df_validado['error'] == '') & (df_validado['cantidad'] > 0)]
+
+    # productos_map viene de la caché y puede estar desactualizado: se vuelve a consultar qué referencias ya existen.
+    refs_nuevas = [productos_ref.document(id_ref) for id_ref in nuevos['id_referencia']]
+    ya_existentes = {doc.id for doc in db.get_all(refs_nuevas) if doc.exists} if refs_nuevas else set()
+    nuevos = nuevos[~nuevos['id_referencia'].isin(ya_existentes)]
+
+    operaciones = [
+        (productos_ref.document(id_ref), {'nombre': nombre, 'precio': float(precio)})
+        for id_ref, nombre, precio in zip(nuevos['id_referencia'], nuevos['nombre'], nuevos['precio'])
+    ]
+    movimientos = [
+        (
+            movimientos_ref.document(hashlib.sha1(f"{id_importacion}|{huella_archivo}|{fila}".encode('utf-8')).hexdigest()),
+            {'id_referencia': id_ref, 'cantidad': int(cantidad), 'tipo_movimiento': 'entrada', 'fecha': fecha}
+        )
+        for fila, id_ref, cantidad in zip(entradas.index, entradas['id_referencia'], entradas['cantidad'])
+    ]
+
+    # Las referencias se confirman antes que los movimientos para no dejar entradas de productos inexistentes.
+    confirmados, total, errores = _confirmar_lotes(operaciones, crear=True)
+    if errores:
+        raise RuntimeError(
+            f"Se confirmaron {confirmados} de {total} lotes de referencias nuevas y ningún movimiento. "
+            f"Puedes reintentar la importación. Detalle: {errores[0]}"
+        )
+    confirmados, total, errores = _confirmar_lotes(movimientos)
+    if errores:
+        raise RuntimeError(
+            f"Se guardaron todas las referencias nuevas y {confirmados} de {total} lotes de movimientos. "
+            f"Si reintentas con el mismo archivo, sin modificarlo, los movimientos ya guardados no se duplicarán. "
+            f"Si cambias el archivo, revisa primero el inventario. Detalle: {errores[0]}"
+        )
+    return len(nuevos), len(entradas)
+
 @st.cache_data
 def obtener_productos():
     """Obtiene todas las referencias de productos de Firestore."""
@@ -370,11 +541,64 @@ def pagina_inventario():
             st.cache_data.clear()
             st.rerun()
 
+    st.markdown("---")
+    st.subheader('📥 Importación Masiva')
+    st.write("Carga un archivo XLSX o CSV con las columnas `id_referencia`, `nombre`, `precio` y `cantidad`. "
+             "Las referencias nuevas requieren nombre y precio; las existentes solo registran la entrada de la cantidad indicada.")
+
+    if 'importacion_key' not in st.session_state:
+        st.session_state.importacion_key = 0
+    if 'importacion_id' not in st.session_state:
+        st.session_state.importacion_id = datetime.now().isoformat()
+
+    archivo_importacion = st.file_uploader(
+        "Archivo de importación",
+        type=['xlsx', 'csv'],
+        key=f"importacion_{st.session_state.importacion_key}"
+    )
+
+    if archivo_importacion is not None:
+        try:
+            df_importacion = validar_importacion(leer_archivo_importacion(archivo_importacion), productos_map)
+        except Exception as e:
+            st.error(f"Error al leer el archivo: {e}")
+            df_importacion = None
+
+        if df_importacion is not None:
+            st.write("#### Vista previa (sin guardar)")
+            col_res1, col_res2, col_res3 = st.columns(3)
+            col_res1.metric("Referencias nuevas", int(df_importacion['crear_producto'].sum()))
+            col_res2.metric("Entradas", int(((df_importacion['error'] == '') & (df_importacion['cantidad'] > 0)).sum()))
+            col_res3.metric("Filas con error", int((df_importacion['error'] != '').sum()))
+            st.dataframe(
+                df_importacion[['id_referencia', 'nombre', 'precio', 'cantidad', 'accion', 'error']],
+                use_container_width=True
+            )
+
+            if (df_importacion['error'] != '').any():
+                st.warning("Las entradas de las filas con error serán omitidas en la importación.")
+
+            if st.button('Confirmar Importación'):
+                try:
+                    total_nuevos, total_entradas = guardar_importacion(
+                        df_importacion, st.session_state.importacion_id, archivo_importacion.getvalue()
+                    )
+                    st.success(f"Importación completada: {total_nuevos} referencias nuevas y {total_entradas} entradas registradas.")
+                    st.session_state.importacion_key += 1
+                    st.session_state.importacion_id = datetime.now().isoformat()
+                    st.cache_data.clear()
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Error al guardar la importación: {e}")
+                    # Algunos lotes pudieron quedar guardados: se refresca la caché para reflejarlos.
+                    st.cache_data.clear()
+
     st.markdown("---")
     st.subheader('📊 Inventario Actual')
     movimientos_inventario = obtener_movimientos_inventario()
     if movimientos_inventario:
-        df_inventario = obtener_inventario_actual(productos_map, movimientos_inventario)
+        # Se vuelve a leer (desde la caché) por si una importación fallida la limpió más arriba.
+        df_inventario = obtener_inventario_actual(obtener_productos(), movimientos_inventario)
         st.dataframe(df_inventario, use_container_width=True)
     else:
         st.info("Aún no hay movimientos de inventario.")